@@ -3,11 +3,16 @@ Embassy Appointment Scheduling System
 A simple web application for scheduling visa interviews with medical exam prerequisites.
 """
 
+import itertools
 import os
+import queue
 import sqlite3
-from datetime import datetime, timedelta
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+import threading
+import time
+from datetime import date
+from flask import Flask, render_template, request, jsonify, make_response, stream_template
 from contextlib import contextmanager
+from werkzeug.exceptions import HTTPException
 import uuid
 
 app = Flask(__name__)
@@ -22,24 +27,125 @@ app.config['MEDICAL_EXAM_VALIDITY_DAYS'] = int(os.getenv('MEDICAL_EXAM_VALIDITY_
 app.config['APP_VERSION'] = os.getenv('APP_VERSION', '1.0.0')
 app.config['ENVIRONMENT'] = os.getenv('ENVIRONMENT', 'development')
 
+# Reject oversized bodies at the WSGI layer before any form parsing;
+# the appointment form is far below this limit
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024
+
+# Rows per page on the appointments listing
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '50'))
+
+# Config values bound once at import so the hot handlers skip the
+# app.config dict lookup per request
+DATABASE = app.config['DATABASE']
+EMBASSY_NAME = app.config['EMBASSY_NAME']
+MEDICAL_REQUIRED = app.config['MEDICAL_EXAM_REQUIRED']
+MEDICAL_EXAM_VALIDITY_DAYS = app.config['MEDICAL_EXAM_VALIDITY_DAYS']
+APP_VERSION = app.config['APP_VERSION']
+ENVIRONMENT = app.config['ENVIRONMENT']
+
+# Fields a submission must carry; checked with a C-level set difference
+REQUIRED_FIELDS = frozenset({'applicant_name', 'email', 'passport_number',
+                             'appointment_date', 'appointment_time',
+                             'medical_exam_date'})
+
+# SQL statements as module-level constants so every pooled connection
+# sees identical text and serves them from its prepared-statement cache
+SQL_LIST = '''
+    SELECT id, applicant_name, email, passport_number,
+           appointment_date, appointment_time, status,
+           medical_exam_date, medical_exam_verified
+    FROM appointments
+    ORDER BY appointment_date DESC, appointment_time DESC
+    LIMIT ? OFFSET ?
+'''
+
+SQL_INSERT = '''
+    INSERT INTO appointments
+    (id, applicant_name, email, passport_number, phone_number,
+     appointment_date, appointment_time, medical_exam_date,
+     medical_exam_verified, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    RETURNING *
+'''
+
+# Project only the columns the detail template renders; created_at and
+# updated_at never leave the database
+SQL_DETAIL = '''
+    SELECT id, applicant_name, email, passport_number, phone_number,
+           appointment_date, appointment_time, status,
+           medical_exam_date, medical_exam_verified
+    FROM appointments
+    WHERE id = ?
+'''
+
+SQL_METRICS = '''
+    SELECT COUNT(*),
+           COALESCE(SUM(status = 'pending'), 0),
+           COALESCE(SUM(status = 'confirmed'), 0)
+    FROM appointments
+'''
+
+# Connection pool - reusing connections avoids the connect/close syscall
+# overhead that dominates short queries (health checks, single-row lookups)
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+# Refresh planner statistics every Nth connection return so the query
+# planner keeps picking the indexes as the table grows
+OPTIMIZE_EVERY = 256
+_pool_returns = itertools.count(1)
+
+def _create_connection():
+    """Create a new pooled SQLite connection with performance pragmas."""
+    conn = sqlite3.connect(DATABASE, check_same_thread=False,
+                           cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-20000')
+    conn.execute('PRAGMA mmap_size=268435456')
+    conn.execute('PRAGMA busy_timeout=5000')
+    conn.execute('PRAGMA foreign_keys=ON')
+    return conn
+
 # Database context manager
 @contextmanager
 def get_db():
-    """Get database connection with context manager."""
-    conn = sqlite3.connect(app.config['DATABASE'])
-    conn.row_factory = sqlite3.Row
+    """Get a pooled database connection with context manager."""
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _create_connection()
     try:
         yield conn
         conn.commit()
+        # Refresh planner stats only on the clean path; a failure here
+        # is a lost optimization, never a masked handler exception
+        if next(_pool_returns) % OPTIMIZE_EVERY == 0:
+            try:
+                conn.execute('PRAGMA optimize')
+            except sqlite3.Error:
+                pass
     except Exception:
         conn.rollback()
         raise
     finally:
-        conn.close()
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
 
 def init_db():
-    """Initialize the database with required tables."""
+    """Initialize the database with required tables.
+
+    Enables WAL journaling so readers (list/metrics/ready) no longer
+    serialize against writers. WAL is sticky on the database file and
+    adds '-wal' and '-shm' sidecar files next to it.
+    """
     with get_db() as conn:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
         conn.execute('''
             CREATE TABLE IF NOT EXISTS appointments (
                 id TEXT PRIMARY KEY,
@@ -56,49 +162,170 @@ def init_db():
                 updated_at TEXT DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS ix_appointments_status
+            ON appointments(status)
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS ix_appointments_date_time
+            ON appointments(appointment_date DESC, appointment_time DESC)
+        ''')
+        # Seed planner statistics so the new indexes are chosen on a cold DB
+        conn.execute('ANALYZE')
 
 # Initialize database on startup
 init_db()
 
+# Write batching - a single worker drains queued writes inside one
+# BEGIN IMMEDIATE ... COMMIT, so a burst of submissions costs one fsync
+# per batch instead of one per row
+MAX_WRITE_BATCH = 32
+WRITE_TIMEOUT = 10.0  # seconds a handler waits for its commit
+_write_queue = queue.Queue()
+
+class _WriteItem:
+    """A queued write plus the event its submitter waits on."""
+    __slots__ = ('sql', 'params', 'done', 'row', 'error')
+
+    def __init__(self, sql, params):
+        self.sql = sql
+        self.params = params
+        self.done = threading.Event()
+        self.row = None
+        self.error = None
+
+def _write_worker():
+    """Drain queued writes in batches on a dedicated connection."""
+    conn = _create_connection()
+    conn.isolation_level = None  # transactions are managed explicitly
+    while True:
+        batch = [_write_queue.get()]
+        while len(batch) < MAX_WRITE_BATCH:
+            try:
+                batch.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for item in batch:
+                try:
+                    item.row = conn.execute(item.sql, item.params).fetchone()
+                except Exception as exc:
+                    item.error = exc
+            conn.execute('COMMIT')
+        except Exception as exc:
+            # Record the failure before attempting rollback: if BEGIN
+            # itself failed (e.g. busy timeout on the write lock) there
+            # is no transaction to roll back and ROLLBACK would raise,
+            # leaving items signalled with no error and killing the
+            # worker thread
+            for item in batch:
+                if item.error is None:
+                    item.error = exc
+            try:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+            except Exception:
+                app.logger.exception('Rollback failed in write worker')
+        finally:
+            # Signal only after COMMIT so submitters see durable writes
+            for item in batch:
+                item.done.set()
+
+def submit_write(sql, params):
+    """Enqueue a write and block until its batch has committed.
+
+    Returns the row produced by a RETURNING clause, if any.
+    """
+    item = _WriteItem(sql, params)
+    _write_queue.put(item)
+    if not item.done.wait(WRITE_TIMEOUT):
+        raise TimeoutError('Timed out waiting for database write to commit')
+    if item.error is not None:
+        raise item.error
+    return item.row
+
+threading.Thread(target=_write_worker, name='db-write-worker', daemon=True).start()
+
+def _utc_timestamp():
+    """UTC timestamp for probe responses via a single C strftime call."""
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
 def validate_medical_exam(exam_date_str):
     """Validate that medical exam is recent enough."""
+    # Cheap shape check so malformed input never reaches the int/date
+    # constructors below
+    if (len(exam_date_str) != 10
+            or exam_date_str[4] != '-' or exam_date_str[7] != '-'):
+        return False, "Invalid date format"
     try:
-        exam_date = datetime.strptime(exam_date_str, '%Y-%m-%d')
-        days_ago = (datetime.now() - exam_date).days
-        validity_days = app.config['MEDICAL_EXAM_VALIDITY_DAYS']
-        
+        # Only day precision is needed; a fixed-position parse avoids
+        # strptime's format machinery on every submission
+        exam_date = date(int(exam_date_str[:4]),
+                         int(exam_date_str[5:7]),
+                         int(exam_date_str[8:10]))
+        days_ago = (date.today() - exam_date).days
+
         if days_ago < 0:
             return False, "Medical exam date cannot be in the future"
-        if days_ago > validity_days:
-            return False, f"Medical exam must be within the last {validity_days} days"
-        
+        if days_ago > MEDICAL_EXAM_VALIDITY_DAYS:
+            return False, f"Medical exam must be within the last {MEDICAL_EXAM_VALIDITY_DAYS} days"
+
         return True, "Medical exam is valid"
     except ValueError:
         return False, "Invalid date format"
 
+# Compiled index template, bound lazily so renders skip the template
+# loader's lookup and stat() calls on every pass
+_index_template = None
+
+def _render_index(**context):
+    """Render index.html from the cached compiled template."""
+    global _index_template
+    if _index_template is None:
+        _index_template = app.jinja_env.get_template('index.html')
+    return _index_template.render(**context)
+
+# The index page depends only on two config values, so cache the
+# rendered HTML per (embassy_name, medical_required) pair
+_index_cache = {}
+
 @app.route('/')
 def index():
     """Main page - appointment scheduling form."""
-    return render_template('index.html', 
-                         embassy_name=app.config['EMBASSY_NAME'],
-                         medical_required=app.config['MEDICAL_EXAM_REQUIRED'])
+    key = (EMBASSY_NAME, MEDICAL_REQUIRED)
+    html = _index_cache.get(key)
+    if html is None:
+        html = _render_index(embassy_name=key[0],
+                             medical_required=key[1])
+        _index_cache[key] = html
+
+    response = make_response(html)
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    response.add_etag()
+    return response.make_conditional(request)
 
 @app.route('/appointments', methods=['GET'])
 def list_appointments():
-    """List all appointments."""
+    """List appointments, newest first, one page at a time."""
+    page = max(request.args.get('page', 1, type=int), 1)
     with get_db() as conn:
-        cursor = conn.execute('''
-            SELECT id, applicant_name, email, passport_number, 
-                   appointment_date, appointment_time, status, 
-                   medical_exam_date, medical_exam_verified
-            FROM appointments 
-            ORDER BY appointment_date DESC, appointment_time DESC
-        ''')
-        appointments = [dict(row) for row in cursor.fetchall()]
-    
-    return render_template('appointments.html', 
-                         appointments=appointments,
-                         embassy_name=app.config['EMBASSY_NAME'])
+        total = conn.execute('SELECT COUNT(*) FROM appointments').fetchone()[0]
+
+    def generate():
+        # Holds the pooled connection only while the response streams;
+        # the composite index on (appointment_date DESC, appointment_time
+        # DESC) lets SQLite hand rows over in order, one at a time
+        with get_db() as conn:
+            yield from conn.execute(SQL_LIST, (PAGE_SIZE, (page - 1) * PAGE_SIZE))
+
+    return stream_template('appointments.html',
+                           appointments=generate(),
+                           total=total,
+                           page=page,
+                           has_prev=page > 1,
+                           has_next=page * PAGE_SIZE < total,
+                           embassy_name=EMBASSY_NAME)
 
 @app.route('/appointments', methods=['POST'])
 def create_appointment():
@@ -108,32 +335,27 @@ def create_appointment():
         data = request.form
         
         # Validate required fields
-        required_fields = ['applicant_name', 'email', 'passport_number', 
-                          'appointment_date', 'appointment_time', 'medical_exam_date']
-        for field in required_fields:
-            if not data.get(field):
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+        missing = REQUIRED_FIELDS - {k for k, v in data.items() if v}
+        if missing:
+            return jsonify({'error': f'Missing required field: {sorted(missing)[0]}'}), 400
         
         # Validate medical exam if required
-        if app.config['MEDICAL_EXAM_REQUIRED']:
+        if MEDICAL_REQUIRED:
             is_valid, message = validate_medical_exam(data['medical_exam_date'])
             if not is_valid:
-                return render_template('index.html', 
-                                     error=message,
-                                     embassy_name=app.config['EMBASSY_NAME'],
-                                     medical_required=app.config['MEDICAL_EXAM_REQUIRED'],
+                return _render_index(error=message,
+                                     embassy_name=EMBASSY_NAME,
+                                     medical_required=MEDICAL_REQUIRED,
                                      form_data=data), 400
         
         # Create appointment
-        appointment_id = str(uuid.uuid4())
-        with get_db() as conn:
-            conn.execute('''
-                INSERT INTO appointments 
-                (id, applicant_name, email, passport_number, phone_number,
-                 appointment_date, appointment_time, medical_exam_date, 
-                 medical_exam_verified, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
+        # .hex skips hyphen formatting and keeps the primary key at 32
+        # chars, so index pages hold more rows
+        appointment_id = uuid.uuid4().hex
+        # The write worker commits this alongside any concurrent inserts;
+        # RETURNING hands back the inserted row, so the confirmation
+        # page renders without a redirect and a second SELECT
+        appointment = submit_write(SQL_INSERT, (
                 appointment_id,
                 data['applicant_name'],
                 data['email'],
@@ -145,51 +367,64 @@ def create_appointment():
                 1,  # Auto-verify for demo
                 'confirmed'
             ))
-        
-        return redirect(url_for('appointment_detail', appointment_id=appointment_id))
+        if appointment is None:
+            # The INSERT has RETURNING, so no row means the write never
+            # happened; never confirm an appointment that was not stored
+            raise RuntimeError('Insert committed without returning a row')
+
+        return render_template('appointment_detail.html',
+                             appointment=appointment,
+                             embassy_name=EMBASSY_NAME)
     
+    except HTTPException:
+        # Let Werkzeug errors (e.g. 413 from the body-size limit) reach
+        # their registered handlers
+        raise
     except Exception as e:
         app.logger.error(f"Error creating appointment: {e}")
-        return render_template('index.html', 
-                             error="An error occurred while creating the appointment",
-                             embassy_name=app.config['EMBASSY_NAME'],
-                             medical_required=app.config['MEDICAL_EXAM_REQUIRED']), 500
+        return _render_index(error="An error occurred while creating the appointment",
+                             embassy_name=EMBASSY_NAME,
+                             medical_required=MEDICAL_REQUIRED), 500
 
 @app.route('/appointments/<appointment_id>')
 def appointment_detail(appointment_id):
     """Get details of a specific appointment."""
     with get_db() as conn:
-        cursor = conn.execute('''
-            SELECT * FROM appointments WHERE id = ?
-        ''', (appointment_id,))
+        cursor = conn.execute(SQL_DETAIL, (appointment_id,))
         appointment = cursor.fetchone()
     
     if not appointment:
         return "Appointment not found", 404
     
-    return render_template('appointment_detail.html', 
-                         appointment=dict(appointment),
-                         embassy_name=app.config['EMBASSY_NAME'])
+    return render_template('appointment_detail.html',
+                         appointment=appointment,
+                         embassy_name=EMBASSY_NAME)
+
+@app.errorhandler(413)
+def payload_too_large(error):
+    """Return a small JSON body for oversized requests."""
+    return jsonify({'error': 'Request payload too large'}), 413
 
 @app.route('/health')
 def health():
     """Health check endpoint for Kubernetes liveness probe."""
     try:
-        # Check database connectivity
+        # Borrow a pooled connection and ping it; with the pool warm this
+        # is a memory operation, not disk IO
         with get_db() as conn:
             conn.execute('SELECT 1')
         
         return jsonify({
             'status': 'healthy',
-            'timestamp': datetime.utcnow().isoformat(),
-            'version': app.config['APP_VERSION'],
-            'environment': app.config['ENVIRONMENT']
+            'timestamp': _utc_timestamp(),
+            'version': APP_VERSION,
+            'environment': ENVIRONMENT
         }), 200
     except Exception as e:
         app.logger.error(f"Health check failed: {e}")
         return jsonify({
             'status': 'unhealthy',
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': _utc_timestamp(),
             'error': str(e)
         }), 503
 
@@ -197,34 +432,40 @@ def health():
 def ready():
     """Readiness check endpoint for Kubernetes readiness probe."""
     try:
-        # Check if application is ready to serve traffic
+        # Check if application is ready to serve traffic; touching one row
+        # proves the schema exists without scanning the whole table
         with get_db() as conn:
-            conn.execute('SELECT COUNT(*) FROM appointments')
+            conn.execute('SELECT 1 FROM appointments LIMIT 1')
         
         return jsonify({
             'status': 'ready',
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': _utc_timestamp()
         }), 200
     except Exception as e:
         app.logger.error(f"Readiness check failed: {e}")
         return jsonify({
             'status': 'not ready',
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': _utc_timestamp(),
             'error': str(e)
         }), 503
 
+# Prometheus scrapes every few seconds per replica; cache the rendered
+# text briefly so concurrent scrapes hit memory instead of SQLite
+METRICS_CACHE_TTL = 5  # seconds
+_metrics_cache = (0.0, '')
+
 @app.route('/metrics')
 def metrics():
     """Basic metrics endpoint (Prometheus-compatible format)."""
+    global _metrics_cache
+    expires, cached_output = _metrics_cache
+    if time.monotonic() < expires:
+        return cached_output, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
     with get_db() as conn:
-        cursor = conn.execute('SELECT COUNT(*) as total FROM appointments')
-        total_appointments = cursor.fetchone()[0]
-        
-        cursor = conn.execute("SELECT COUNT(*) as pending FROM appointments WHERE status = 'pending'")
-        pending_appointments = cursor.fetchone()[0]
-        
-        cursor = conn.execute("SELECT COUNT(*) as confirmed FROM appointments WHERE status = 'confirmed'")
-        confirmed_appointments = cursor.fetchone()[0]
+        # Single scan instead of three separate COUNT(*) queries
+        row = conn.execute(SQL_METRICS).fetchone()
+        total_appointments, pending_appointments, confirmed_appointments = row
     
     metrics_output = f"""# HELP appointments_total Total number of appointments
 # TYPE appointments_total counter
@@ -240,9 +481,10 @@ appointments_confirmed {confirmed_appointments}
 
 # HELP app_info Application information
 # TYPE app_info gauge
-app_info{{version="{app.config['APP_VERSION']}",environment="{app.config['ENVIRONMENT']}"}} 1
+app_info{{version="{APP_VERSION}",environment="{ENVIRONMENT}"}} 1
 """
-    
+
+    _metrics_cache = (time.monotonic() + METRICS_CACHE_TTL, metrics_output)
     return metrics_output, 200, {'Content-Type': 'text/plain; charset=utf-8'}
 
 if __name__ == '__main__':